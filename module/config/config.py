@@ -1,10 +1,13 @@
-import copy
+import bisect
 import datetime
+import functools
 import operator
 import threading
+import time
 
 import pywebio
 
+from module.base.decorator import cached_property
 from module.base.filter import Filter
 from module.config.config_generated import GeneratedConfig
 from module.config.config_manual import ManualConfig, OutputConfig
@@ -16,11 +19,22 @@ from module.logger import logger
 from module.map.map_grids import SelectedGrids
 
 
+# Arguments to force OpSi tasks to run regardless of recon scan and submarine call
+OPSI_FORCE_RUN_KEYS = (
+    "OpsiExplore.ForceRun",
+    "OpsiObscure.ForceRun",
+    "OpsiAbyssal.ForceRun",
+    "OpsiStronghold.ForceRun",
+)
+
+
 class TaskEnd(Exception):
     pass
 
 
 class Function:
+    __slots__ = ("enable", "command", "next_run")
+
     def __init__(self, data):
         self.enable = deep_get(data, keys="Scheduler.Enable", default=False)
         self.command = deep_get(data, keys="Scheduler.Command", default="Unknown")
@@ -56,15 +70,60 @@ def name_to_function(name):
     return function
 
 
+@functools.lru_cache(maxsize=None)
+def get_func_set(func, base=frozenset({"General", "Alas"})):
+    """
+    Args:
+        func (str): Function to run
+        base (frozenset[str]): Tasks always to be bound
+
+    Returns:
+        frozenset[str]: Set of tasks to be bound
+    """
+    func_set = set(base)
+    func_set.add(func)
+    if func.startswith("Opsi"):
+        func_set.add("OpsiGeneral")
+    if (
+        func.startswith("Event")
+        or func.startswith("Raid")
+        or func in ["MaritimeEscort", "GemsFarming"]
+    ):
+        func_set.add("EventGeneral")
+        func_set.add("TaskBalancer")
+    return frozenset(func_set)
+
+
+@functools.lru_cache(maxsize=None)
+def class_attrs(cls):
+    """
+    Args:
+        cls (type):
+
+    Returns:
+        tuple[str]: Non-magic attribute names of a class, including inherited ones.
+    """
+    return tuple(attr for attr in dir(cls) if not attr.endswith("__"))
+
+
 class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher):
     stop_event: threading.Event = None
     bound = {}
+    # Keys of `bound`, frozen after `bind()`
+    _bound_keys = frozenset()
+    # Optimization settings, updated in `load()`
+    _hoarding = timedelta(0)
+    _close_game = False
 
     # Class property
     is_hoarding_task = True
 
     def __setattr__(self, key, value):
-        if key in self.bound:
+        # Private attributes are never bound to config file
+        if key.startswith("_"):
+            object.__setattr__(self, key, value)
+            return
+        if key in self._bound_keys:
             path = self.bound[key]
             self.modified[path] = value
             if self.auto_update:
@@ -83,6 +142,8 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
         self.modified = {}
         # Key: Argument name in GeneratedConfig. Value: Path in `data`.
         self.bound = {}
+        # Key: Task name. Value: Arguments of the task to bind, see `get_flat_bindings()`.
+        self._flat_bindings = {}
         # If write after every variable modification.
         self.auto_update = True
         # Force override variables
@@ -93,6 +154,13 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
         # waiting_task: Run time haven't been reached, wait needed.
         self.pending_task = []
         self.waiting_task = []
+        # Enabled tasks sorted by next_run then priority, built in `load()`.
+        # Item: (next_run, priority, Function)
+        self._sorted_tasks = []
+        # Enabled tasks with invalid NextRun
+        self._error_task = []
+        # (task, file stamp) of the last `task_switched()` that didn't switch
+        self._switch_checked = None
         # Task to run and bind.
         # Task means the name of the function to run in AzurLaneAutoScript class.
         self.task: Function
@@ -116,9 +184,28 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
     def load(self):
         self.data = self.read_file(self.config_name)
         self.config_override()
+        # Usually empty, since `save()` clears it
+        if self.modified:
+            self.apply_modified()
+
+        self.load_optimization()
+        self.build_task_queue()
 
+    def apply_modified(self):
+        """
+        Write `modified` into `data`.
+        Paths are grouped by task, so each task dict is fetched from `data` once.
+        """
+        grouped = {}
         for path, value in self.modified.items():
-            deep_set(self.data, keys=path, value=value)
+            task, _, rest = path.partition(".")
+            grouped.setdefault(task, []).append((rest, value))
+
+        for task, items in grouped.items():
+            task_data = self.data.get(task, {})
+            for rest, value in items:
+                task_data = deep_set(task_data, keys=rest, value=value) if rest else value
+            self.data[task] = task_data
 
     def bind(self, func, func_set=None):
         """
@@ -126,89 +213,133 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
             func (str, Function): Function to run
             func_set (set): Set of tasks to be bound
         """
-        if func_set is None:
-            func_set = {"General", "Alas"}
         if isinstance(func, Function):
             func = func.command
-        func_set.add(func)
-        if func.startswith("Opsi"):
-            func_set.add("OpsiGeneral")
-        if (
-            func.startswith("Event")
-            or func.startswith("Raid")
-            or func in ["MaritimeEscort", "GemsFarming"]
-        ):
-            func_set.add("EventGeneral")
-            func_set.add("TaskBalancer")
-        logger.info(f"Bind task {func_set}")
+        if func_set is None:
+            func_set = get_func_set(func)
+        else:
+            func_set = get_func_set(func, base=frozenset(func_set))
+        logger.info(f"Bind task {set(func_set)}")
 
         # Bind arguments
         visited = set()
         self.bound.clear()
         for func in func_set:
             func_data = self.data.get(func, {})
-            for group, group_data in func_data.items():
-                for arg, value in group_data.items():
-                    path = f"{group}.{arg}"
-                    if path in visited:
-                        continue
-                    arg = path_to_arg(path)
-                    super().__setattr__(arg, value)
-                    self.bound[arg] = f"{func}.{path}"
-                    visited.add(path)
+            for group, arg, path, arg_name, bound in self.get_flat_bindings(func):
+                if path in visited:
+                    continue
+                super().__setattr__(arg_name, func_data[group][arg])
+                self.bound[arg_name] = bound
+                visited.add(path)
+        self._bound_keys = frozenset(self.bound)
 
         # Override arguments
         for arg, value in self.overridden.items():
             super().__setattr__(arg, value)
 
+    def get_flat_bindings(self, func):
+        """
+        Args:
+            func (str): Task name
+
+        Returns:
+            list[tuple[str, str, str, str, str]]: List of (group, arg, path, arg_name, bound),
+                such as ("Scheduler", "Enable", "Scheduler.Enable", "Scheduler_Enable", "Main.Scheduler.Enable")
+        """
+        # Structure of `data` is fixed by arguments, build only once for each task
+        bindings = self._flat_bindings.get(func)
+        if bindings is None:
+            bindings = []
+            for group, group_data in self.data.get(func, {}).items():
+                for arg in group_data:
+                    path = f"{group}.{arg}"
+                    bindings.append((group, arg, path, path_to_arg(path), f"{func}.{path}"))
+            if bindings:
+                self._flat_bindings[func] = bindings
+        return bindings
+
     @property
     def hoarding(self):
+        return self._hoarding
+
+    @property
+    def close_game(self):
+        return self._close_game
+
+    def load_optimization(self):
+        """
+        Cache optimization settings used by scheduler, they only change when config reloaded.
+        """
         minutes = int(
             deep_get(
                 self.data, keys="Alas.Optimization.TaskHoardingDuration", default=0
             )
         )
-        return timedelta(minutes=max(minutes, 0))
-
-    @property
-    def close_game(self):
-        return deep_get(
+        self._hoarding = timedelta(minutes=max(minutes, 0))
+        self._close_game = deep_get(
             self.data, keys="Alas.Optimization.CloseGameDuringWait", default=False
         )
 
-    def get_next_task(self):
+    @cached_property
+    def _priority_index(self):
         """
-        Calculate tasks, set pending_task and waiting_task
+        SCHEDULER_PRIORITY is a class attribute, so it's parsed once per instance.
+
+        Returns:
+            dict: Key: Lowercase task name. Value: Index in SCHEDULER_PRIORITY, smaller is higher.
+                Tasks not in SCHEDULER_PRIORITY are not scheduled.
         """
-        pending = []
-        waiting = []
+        f = Filter(regex=r"(.*)", attr=["command"])
+        f.load(self.SCHEDULER_PRIORITY)
+        index = {}
+        for priority, (command,) in enumerate(f.filter):
+            index.setdefault(command, priority)
+        return index
+
+    def build_task_queue(self):
+        """
+        Parse all tasks in `data` and build scheduler queue from scratch.
+        """
+        enabled = []
         error = []
-        now = datetime.now()
-        if AzurLaneConfig.is_hoarding_task:
-            now -= self.hoarding
         for func in self.data.values():
             func = Function(func)
             if not func.enable:
                 continue
             if not isinstance(func.next_run, datetime):
                 error.append(func)
-            elif func.next_run < now:
-                pending.append(func)
             else:
-                waiting.append(func)
+                enabled.append(func)
+
+        self._error_task = error
+        tasks = []
+        index = self._priority_index
+        for func in enabled:
+            priority = index.get(str(func.command).lower())
+            if priority is not None:
+                tasks.append((func.next_run, priority, func))
+        tasks.sort()
+        self._sorted_tasks = tasks
 
-        f = Filter(regex=r"(.*)", attr=["command"])
-        f.load(self.SCHEDULER_PRIORITY)
-        if pending:
-            pending = f.apply(pending)
-        if waiting:
-            waiting = f.apply(waiting)
-            waiting = sorted(waiting, key=operator.attrgetter("next_run"))
-        if error:
-            pending = error + pending
+    def get_next_task(self):
+        """
+        Calculate tasks, set pending_task and waiting_task
+        """
+        now = datetime.now()
+        if AzurLaneConfig.is_hoarding_task:
+            now -= self.hoarding
+        tasks = self._sorted_tasks
+        # `(now,)` is less than any item with next_run == now, so the index splits at next_run < now
+        index = bisect.bisect_left(tasks, (now,))
+
+        # Tasks in queue are enabled and in SCHEDULER_PRIORITY already, just sort by priority
+        pending = [entry[2] for entry in sorted(tasks[:index], key=operator.itemgetter(1))]
+        if self._error_task:
+            pending = self._error_task + pending
 
         self.pending_task = pending
-        self.waiting_task = waiting
+        self.waiting_task = [entry[2] for entry in tasks[index:]]
 
     def get_next(self):
         """
@@ -228,8 +359,12 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
 
         if self.waiting_task:
             logger.info("No task pending")
-            task = copy.deepcopy(self.waiting_task[0])
-            task.next_run = (task.next_run + self.hoarding).replace(microsecond=0)
+            # Copy of the nearest waiting task, next_run is shifted by hoarding on the copy only
+            src = self.waiting_task[0]
+            task = Function.__new__(Function)
+            task.enable = src.enable
+            task.command = src.command
+            task.next_run = (src.next_run + self.hoarding).replace(microsecond=0)
             logger.attr("Task", task)
             return task
         else:
@@ -237,15 +372,14 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
             logger.critical("Please enable at least one task")
             raise RequestHumanTakeover
 
-    def save(self, mod_name='alas'):
+    def save(self):
         if not self.modified:
             return False
 
-        for path, value in self.modified.items():
-            deep_set(self.data, keys=path, value=value)
+        self.apply_modified()
 
         logger.info(
-            f"Save config {filepath_config(self.config_name, mod_name)}, {dict_to_kv(self.modified)}"
+            f"Save config {self.config_filepath}, {dict_to_kv(self.modified)}"
         )
         # Don't use self.modified = {}, that will create a new object.
         self.modified.clear()
@@ -310,22 +444,39 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
             **kwargs: For example, `Emotion1_Value=150`
                 will set `Emotion1_Value=150` and `Emotion1_Record=now()`
         """
-        with self.multi_set():
+        with self.multi_set(needs_bind=False):
             for arg, value in kwargs.items():
                 record = arg.replace("Value", "Record")
-                self.__setattr__(arg, value)
-                self.__setattr__(record, datetime.now().replace(microsecond=0))
+                self._fast_set(arg, value)
+                self._fast_set(record, datetime.now().replace(microsecond=0))
+
+    def _fast_set(self, arg, value):
+        """
+        Set an argument into `modified` and the attribute itself,
+        so it doesn't need `bind()` to take effect.
+        """
+        path = self.bound.get(arg)
+        if path is not None:
+            self.modified[path] = value
+        if arg not in self.overridden:
+            object.__setattr__(self, arg, value)
 
-    def multi_set(self):
+    def multi_set(self, needs_bind=True):
         """
         Set multiple arguments but save once.
 
+        Args:
+            needs_bind (bool): False to skip `bind()` on exit,
+                if all arguments are set by `_fast_set()`. Config file is still read before saving,
+                but attributes of other bound arguments are not refreshed from the newly loaded data
+                until the next `bind()`.
+
         Examples:
             with self.config.multi_set():
                 self.config.foo1 = 1
                 self.config.foo2 = 2
         """
-        return MultiSetWrapper(main=self)
+        return MultiSetWrapper(main=self, needs_bind=needs_bind)
 
     def cross_get(self, keys, default=None):
         """
@@ -379,27 +530,32 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
         def ensure_delta(delay):
             return timedelta(seconds=int(ensure_time(delay, precision=3) * 60))
 
-        run = []
+        # Nearest run time of the given arguments, None if no argument is given
+        run = None
+
+        def nearer(candidate):
+            return candidate if run is None or candidate < run else run
+
+        now = datetime.now()
         if success is not None:
             interval = (
                 self.Scheduler_SuccessInterval
                 if success
                 else self.Scheduler_FailureInterval
             )
-            run.append(datetime.now() + ensure_delta(interval))
+            run = nearer(now + ensure_delta(interval))
         if server_update is not None:
             if server_update is True:
                 server_update = self.Scheduler_ServerUpdate
-            run.append(get_server_next_update(server_update))
+            run = nearer(get_server_next_update(server_update))
         if target is not None:
-            target = [target] if not isinstance(target, list) else target
-            target = nearest_future(target)
-            run.append(target)
+            target = nearest_future(target if isinstance(target, list) else [target])
+            run = nearer(target)
         if minute is not None:
-            run.append(datetime.now() + ensure_delta(minute))
+            run = nearer(now + ensure_delta(minute))
 
-        if len(run):
-            run = min(run).replace(microsecond=0)
+        if run is not None:
+            run = run.replace(microsecond=0)
             kv = dict_to_kv(
                 {
                     "success": success,
@@ -448,40 +604,32 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
                 if current < next_run:
                     logger.info(f"Delay task `{task}` to {next_run} ({kv})")
                     self.modified[keys] = next_run
-
-        def is_submarine_call(task):
-            return (
-                deep_get(self.data, keys=f"{task}.OpsiFleet.Submarine", default=False)
-                or "submarine"
-                in deep_get(
-                    self.data, keys=f"{task}.OpsiFleetFilter.Filter", default=""
-                ).lower()
-            )
-
-        def is_force_run(task):
-            return (
-                deep_get(self.data, keys=f"{task}.OpsiExplore.ForceRun", default=False)
-                or deep_get(
-                    self.data, keys=f"{task}.OpsiObscure.ForceRun", default=False
-                )
-                or deep_get(
-                    self.data, keys=f"{task}.OpsiAbyssal.ForceRun", default=False
+                    # Later `delay_tasks()` calls compare against the value just set
+                    deep_set(self.data, keys=keys, value=next_run)
+
+        classified = {}
+
+        def classify(task):
+            """
+            Returns:
+                tuple[bool, bool, bool]: is_submarine_call, is_force_run, is_special_radar
+            """
+            if task not in classified:
+                data = self.data.get(task, {})
+                classified[task] = (
+                    bool(
+                        deep_get(data, keys="OpsiFleet.Submarine", default=False)
+                        or "submarine"
+                        in deep_get(data, keys="OpsiFleetFilter.Filter", default="").lower()
+                    ),
+                    any(deep_get(data, keys=key, default=False) for key in OPSI_FORCE_RUN_KEYS),
+                    bool(deep_get(data, keys="OpsiExplore.SpecialRadar", default=False)),
                 )
-                or deep_get(
-                    self.data, keys=f"{task}.OpsiStronghold.ForceRun", default=False
-                )
-            )
-
-        def is_special_radar(task):
-            return deep_get(
-                self.data, keys=f"{task}.OpsiExplore.SpecialRadar", default=False
-            )
+            return classified[task]
 
         if recon_scan:
             tasks = SelectedGrids(["OpsiExplore", "OpsiObscure", "OpsiStronghold"])
-            tasks = tasks.delete(tasks.filter(is_force_run)).delete(
-                tasks.filter(is_special_radar)
-            )
+            tasks = tasks.filter(lambda x: not classify(x)[1] and not classify(x)[2])
             delay_tasks(tasks, minutes=27)
         if submarine_call:
             tasks = SelectedGrids(
@@ -494,7 +642,7 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
                     "OpsiMeowfficerFarming",
                 ]
             )
-            tasks = tasks.filter(is_submarine_call).delete(tasks.filter(is_force_run))
+            tasks = tasks.filter(lambda x: classify(x)[0] and not classify(x)[1])
             delay_tasks(tasks, minutes=60)
         if ap_limit:
             tasks = SelectedGrids(
@@ -531,16 +679,24 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
         Returns:
             bool: If called.
         """
-        if deep_get(self.data, keys=f"{task}.Scheduler.NextRun", default=None) is None:
+        next_run = deep_get(self.data, keys=f"{task}.Scheduler.NextRun", default=None)
+        if next_run is None:
             raise ScriptError(f"Task to call: `{task}` does not exist in user config")
 
-        if force_call or deep_get(
-            self.data, keys=f"{task}.Scheduler.Enable", default=False
-        ):
+        enable = deep_get(self.data, keys=f"{task}.Scheduler.Enable", default=False)
+        if force_call or enable:
             logger.info(f"Task call: {task}")
-            self.modified[f"{task}.Scheduler.NextRun"] = datetime.now().replace(
-                microsecond=0
-            )
+            now = datetime.now().replace(microsecond=0)
+            # Task is enabled and already due, calling it again changes nothing
+            if (
+                enable is True
+                and isinstance(next_run, datetime)
+                and next_run <= now
+                and f"{task}.Scheduler.NextRun" not in self.modified
+                and f"{task}.Scheduler.Enable" not in self.modified
+            ):
+                return True
+            self.modified[f"{task}.Scheduler.NextRun"] = now
             self.modified[f"{task}.Scheduler.Enable"] = True
             if self.auto_update:
                 self.update()
@@ -574,10 +730,25 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
             if self.stop_event.is_set():
                 return True
         prev = self.task
+        stamp = self.get_stamp()
+        # Config file unchanged since last check and no waiting task reached,
+        # scheduler would give the same result, skip reloading.
+        if self._switch_checked == (prev, stamp) and not self.modified:
+            now = datetime.now()
+            if AzurLaneConfig.is_hoarding_task:
+                now -= self.hoarding
+            if not self.waiting_task or self.waiting_task[0].next_run >= now:
+                logger.info(f"Continue task `{prev}`")
+                return False
+        self._switch_checked = None
         self.load()
         new = self.get_next()
         if prev == new:
             logger.info(f"Continue task `{new}`")
+            # A write in the same timestamp tick as the stamp wouldn't change it,
+            # so only trust stamps that are clearly older than now.
+            if stamp is not None and time.time_ns() - stamp[0] > 2 * 10 ** 9:
+                self._switch_checked = (prev, stamp)
             return False
         else:
             logger.info(f"Switch task `{prev}` to `{new}`")
@@ -621,10 +792,13 @@ class AzurLaneConfig(ConfigUpdater, ManualConfig, GeneratedConfig, ConfigWatcher
         # config = copy.copy(self)
         config = self
 
-        for attr in dir(config):
+        # Copy attributes defined on `other` that `config` has as well
+        attrs = set(class_attrs(type(other)))
+        attrs.update(getattr(other, "__dict__", {}))
+        for attr in sorted(attrs):
             if attr.endswith("__"):
                 continue
-            if hasattr(other, attr):
+            if attr in config.__dict__ or hasattr(type(config), attr):
                 value = other.__getattribute__(attr)
                 if value is not None:
                     config.__setattr__(attr, value)
@@ -705,6 +879,8 @@ pywebio.pin.Output = OutputConfig
 
 
 class ConfigBackup:
+    __slots__ = ("config", "backup", "kwargs")
+
     def __init__(self, config):
         """
         Args:
@@ -726,13 +902,17 @@ class ConfigBackup:
 
 
 class MultiSetWrapper:
-    def __init__(self, main):
+    __slots__ = ("main", "in_wrapper", "needs_bind")
+
+    def __init__(self, main, needs_bind=True):
         """
         Args:
             main (AzurLaneConfig):
+            needs_bind (bool):
         """
         self.main = main
         self.in_wrapper = False
+        self.needs_bind = needs_bind
 
     def __enter__(self):
         if self.main.auto_update:
@@ -743,5 +923,10 @@ class MultiSetWrapper:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if not self.in_wrapper:
-            self.main.update()
+            if self.needs_bind:
+                self.main.update()
+            else:
+                # Still reload, so modifications from others are not overwritten by outdated `data`
+                self.main.load()
+                self.main.save()
             self.main.auto_update = True
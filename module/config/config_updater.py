@@ -487,6 +487,15 @@ class ConfigUpdater:
     def args(self):
         return read_file(filepath_args())
 
+    @cached_property
+    def args_flatten(self):
+        """
+        Returns:
+            list[tuple[list[str], dict]]: Path and definition of each argument, such as
+                (['Main', 'Scheduler', 'Enable'], {'type': 'checkbox', 'value': False})
+        """
+        return list(deep_iter(self.args, depth=3))
+
     def config_update(self, old, is_template=False):
         """
         Args:
@@ -498,16 +507,15 @@ class ConfigUpdater:
         """
         new = {}
 
-        def deep_load(keys):
-            data = deep_get(self.args, keys=keys, default={})
+        def deep_load(keys, data):
             value = deep_get(old, keys=keys, default=data['value'])
             if is_template or value is None or value == '' or data['type'] == 'lock' or data.get('display') == 'hide':
                 value = data['value']
             value = parse_value(value, data=data)
             deep_set(new, keys=keys, value=value)
 
-        for path, _ in deep_iter(self.args, depth=3):
-            deep_load(path)
+        for path, data in self.args_flatten:
+            deep_load(path, data)
 
         # AzurStatsID
         if is_template:
@@ -3,6 +3,7 @@ import os
 import random
 import string
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 
 import yaml
 from filelock import FileLock
@@ -371,9 +372,11 @@ def data_to_path(data):
     return '.'.join([data.get(attr, '') for attr in ['func', 'group', 'arg']])
 
 
+@lru_cache(maxsize=None)
 def path_to_arg(path):
     """
     Convert dictionary keys in .yaml files to argument names in config.
+    Results are cached, since paths are from a fixed set of arguments.
 
     Args:
         path (str): Such as `Scheduler.ServerUpdate`
@@ -1,6 +1,7 @@
 import os
 from datetime import datetime
 
+from module.base.decorator import cached_property
 from module.config.utils import filepath_config, DEFAULT_TIME
 from module.logger import logger
 
@@ -12,14 +13,35 @@ class ConfigWatcher:
     def start_watching(self) -> None:
         self.start_mtime = self.get_mtime()
 
+    def get_filepath(self) -> str:
+        return filepath_config(self.config_name)
+
+    @cached_property
+    def config_filepath(self) -> str:
+        # config_name doesn't change during the lifetime of config
+        return self.get_filepath()
+
     def get_mtime(self) -> datetime:
         """
         Last modify time of the file
         """
-        timestamp = os.stat(filepath_config(self.config_name)).st_mtime
+        timestamp = os.stat(self.config_filepath).st_mtime
         mtime = datetime.fromtimestamp(timestamp).replace(microsecond=0)
         return mtime
 
+    def get_stamp(self):
+        """
+        Returns:
+            tuple[int, int]: Modify time in nanoseconds and size of the file,
+                to detect modifications more precisely than `get_mtime()`.
+                None if file not exists.
+        """
+        try:
+            stat = os.stat(self.config_filepath)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
     def should_reload(self) -> bool:
         """
         Returns:
@@ -1,6 +1,3 @@
-import os
-from datetime import datetime
-
 from module.config.config import AzurLaneConfig, name_to_function
 from module.config.utils import filepath_config
 
@@ -31,13 +28,8 @@ class ArknightsConfig(AzurLaneConfig, ConfigUpdater, GeneratedConfig):
             func_set = {'Maa'}
         super().bind(func, func_set)
 
-    def save(self, mod_name='maa'):
-        super().save(mod_name)
-
-    def get_mtime(self):
-        timestamp = os.stat(filepath_config(self.config_name, mod_name='maa')).st_mtime
-        mtime = datetime.fromtimestamp(timestamp).replace(microsecond=0)
-        return mtime
+    def get_filepath(self):
+        return filepath_config(self.config_name, mod_name='maa')
 
 
 def load_config(config_name, task):
@@ -84,16 +84,15 @@ class ConfigUpdater(config_updater.ConfigUpdater):
         """
         new = {}
 
-        def deep_load(keys):
-            data = deep_get(self.args, keys=keys, default={})
+        def deep_load(keys, data):
             value = deep_get(old, keys=keys, default=data['value'])
             if is_template or value is None or value == '' or data['type'] == 'lock' or data.get('display') == 'hide':
                 value = data['value']
             value = parse_value(value, data=data)
             deep_set(new, keys=keys, value=value)
 
-        for path, _ in deep_iter(self.args, depth=3):
-            deep_load(path)
+        for path, data in self.args_flatten:
+            deep_load(path, data)
 
         if not is_template:
             new = self.config_redirect(old, new)